@@ -0,0 +1,13 @@
+#!/system/bin/sh
+# Quest Screen Capture frame server
+# Pushed to /data/local/tmp and reached from the PC through 'adb forward'.
+# Every client gets back-to-back raw screencap frames until it disconnects.
+
+PORT=${1:-27183}
+
+# Report our PID (kept by exec) so the PC can stop the listener
+echo $$
+
+# Bind to localhost only so the screen is not exposed on the Wi-Fi network;
+# each client loop ends once screencap fails to write to a closed connection
+exec nc -L -s 127.0.0.1 -p "$PORT" sh -c 'while screencap; do :; done'
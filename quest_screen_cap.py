@@ -10,16 +10,128 @@ import os
 import sys
 from datetime import datetime
 import threading
+import queue
 import socket
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 try:
     import tkinter as tk
     from tkinter import ttk
     from PIL import Image, ImageTk
-    import io
     GUI_AVAILABLE = True
 except ImportError:
     GUI_AVAILABLE = False
     print("Note: PIL (Pillow) and tkinter not available. Real-time viewer will be disabled.")
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    PYAV_AVAILABLE = False
+
+# screencap raw pixel formats with 4 bytes per pixel, mapped to PIL (mode, rawmode);
+# RGBX_8888's fourth byte is undefined, so it must not be read as alpha
+RAW_PIXEL_MODES = {1: ('RGBA', 'RGBA'), 2: ('RGB', 'RGBX')}
+
+# On-device frame server (frame_server.sh) and the port forwarded to it
+FRAME_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frame_server.sh')
+FRAME_SERVER_DEVICE_PATH = '/data/local/tmp/frame_server.sh'
+FRAME_SERVER_PORT = 27183
+# Port the local adb server listens on for client connections
+ADB_SERVER_PORT = 5037
+# Raw frame buffers and PhotoImages recycled by the real-time viewer
+FRAME_POOL_SIZE = 3
+# Frames the real-time viewer processes concurrently while the next one is read
+PIPELINE_DEPTH = 2
+
+def _safe_float(text, default):
+    """Parse a positive number typed into a control, falling back to default"""
+    try:
+        value = float(text)
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+def _fix_crlf(data):
+    """Undo the LF -> CRLF translation a PTY-backed 'adb shell' applies to binary output"""
+    # bytes.replace is already a single pass in C; a numpy mask would need several
+    return data.replace(b'\r\n', b'\n')
+
+def _readinto_exact(stream, buffer):
+    """Fill buffer completely from an unbuffered pipe without extra copies"""
+    view = memoryview(buffer).cast('B')
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            raise EOFError("ADB stream closed unexpectedly")
+        filled += count
+
+def _read_exact(stream, size):
+    """Read exactly size bytes from an unbuffered pipe into a single new buffer"""
+    data = bytearray(size)
+    _readinto_exact(stream, data)
+    return data
+
+def _recv_exact(sock, size):
+    """Receive exactly size bytes from a socket"""
+    data = bytearray(size)
+    view = memoryview(data)
+    filled = 0
+    while filled < size:
+        count = sock.recv_into(view[filled:])
+        if not count:
+            raise EOFError("ADB server closed the connection")
+        filled += count
+    return bytes(data)
+
+class _AdbServiceRefused(RuntimeError):
+    """The device was reached but adbd rejected the requested service"""
+
+class _AdbClient:
+    """Speaks the adb server's socket protocol directly instead of launching the adb binary"""
+    def __init__(self, serial=None, host='127.0.0.1', port=ADB_SERVER_PORT):
+        self.serial = serial
+        self.host = host
+        self.port = port
+    
+    def _request(self, sock, request):
+        """Send a length-prefixed request and wait for the server to accept it"""
+        data = request.encode()
+        sock.sendall(b'%04x' % len(data) + data)
+        status = _recv_exact(sock, 4)
+        if status != b'OKAY':
+            length = int(_recv_exact(sock, 4), 16)
+            message = _recv_exact(sock, length).decode(errors='replace')
+            raise RuntimeError(f"ADB request '{request}' failed: {message}")
+    
+    def open(self, service, timeout=None):
+        """Open a device service (e.g. 'exec:screencap') and return its socket"""
+        sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        try:
+            if self.serial:
+                self._request(sock, f'host:transport:{self.serial}')
+            else:
+                self._request(sock, 'host:transport-any')
+            try:
+                self._request(sock, service)
+            except RuntimeError as e:
+                raise _AdbServiceRefused(str(e)) from e
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+    
+    def run(self, command, service='exec', timeout=None):
+        """Run a command on the device and return everything it writes to stdout"""
+        with self.open(f'{service}:{command}', timeout=timeout) as sock:
+            with sock.makefile('rb') as output:
+                return output.read()
 
 class QuestADBCapture:
     def __init__(self, device_ip=None, adb_port=5555):
@@ -27,6 +139,32 @@ class QuestADBCapture:
         self.adb_port = adb_port
         self.connected = False
         self.streaming = False
+        self._frame_count = 0  # Frames saved by the live stream
+        # Direct adb server client; connect/disconnect still go through the adb CLI
+        self._adb = _AdbClient(f'{device_ip}:{adb_port}' if device_ip else None)
+        # Raw frame format, fixed for the session once the first frame has been probed
+        self._fw = None
+        self._fh = None
+        self._fheader = None  # 12 or 16 bytes depending on the Android version
+        self._fbytes = None  # Pixel bytes per frame
+        self._fformat = None  # screencap pixel format (1 = RGBA_8888, 2 = RGBX_8888)
+        self._frame_to_image = None  # Image.frombuffer specialised for the frame size
+        self._adb_ok = None  # Set once 'adb version' has succeeded
+        self._use_exec_out = None  # Whether 'adb exec-out' works, probed on first capture
+        self._shell = None  # Socket of the persistent device shell, opened on first capture
+        self._shell_out = None
+        self._shell_tag = 0  # Counter for the end-of-output tags echoed by the shell
+        self._shell_lock = threading.Lock()
+        self._frame_server = None  # Socket of the shell running frame_server.sh
+        self._frame_server_pid = None  # PID of its nc listener on the device
+        # Viewer FPS and scale, updated by write traces on the entries instead of parsed per frame
+        self._fps = 10.0
+        self._scale = 0.5
+        self._last_scale = None  # Preview scale _new_wh was computed for
+        self._new_wh = None
+        self._frame_pool = None  # Reusable raw frame buffers, allocated once the size is known
+        self._free_slots = queue.Queue()
+        self._last_drawn_frame = -1  # Frame number currently shown by the viewer
         self.output_folder = self.setup_output_folder()
         
     def setup_output_folder(self):
@@ -70,10 +208,16 @@ class QuestADBCapture:
         
     def check_adb_installed(self):
         """Check if ADB is installed and accessible"""
+        if self._adb_ok:
+            # Already verified this session; skip spawning adb again on reconnect
+            return True
+        
         try:
-            result = subprocess.run(['adb', 'version'], capture_output=True, text=True)
+            # Only the exit code matters, so don't capture or decode the output
+            result = subprocess.run(['adb', 'version'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             if result.returncode == 0:
                 print("ADB is installed and accessible")
+                self._adb_ok = True
                 return True
             else:
                 print("ADB not found. Please install Android SDK Platform Tools")
@@ -92,20 +236,20 @@ class QuestADBCapture:
                 # Connect via WiFi
                 print(f"Connecting to {self.device_ip}:{self.adb_port}")
                 result = subprocess.run(['adb', 'connect', f'{self.device_ip}:{self.adb_port}'], 
-                                      capture_output=True, text=True)
-                if "connected" in result.stdout.lower():
+                                      capture_output=True)
+                if b"connected" in result.stdout.lower():
                     print("Successfully connected via WiFi")
                     self.connected = True
                 else:
-                    print(f"Failed to connect: {result.stdout}")
+                    print(f"Failed to connect: {result.stdout.decode(errors='replace')}")
                     return False
             else:
                 # Check for USB connected devices with retry logic
                 max_attempts = 3
                 for attempt in range(max_attempts):
-                    result = subprocess.run(['adb', 'devices'], capture_output=True, text=True)
-                    lines = result.stdout.strip().split('\n')[1:]  # Skip header
-                    devices = [line.split('\t')[0] for line in lines if '\tdevice' in line]
+                    result = subprocess.run(['adb', 'devices'], capture_output=True)
+                    lines = result.stdout.splitlines()[1:]  # Skip header
+                    devices = [line.split(b'\t')[0].decode() for line in lines if b'\tdevice' in line]
                     
                     if devices:
                         print(f"Found {len(devices)} device(s): {', '.join(devices)}")
@@ -133,20 +277,10 @@ class QuestADBCapture:
             return None
             
         try:
-            # Get device model
-            model_result = subprocess.run(['adb', 'shell', 'getprop', 'ro.product.model'], 
-                                        capture_output=True, text=True)
-            model = model_result.stdout.strip()
-            
-            # Get Android version
-            version_result = subprocess.run(['adb', 'shell', 'getprop', 'ro.build.version.release'], 
-                                          capture_output=True, text=True)
-            android_version = version_result.stdout.strip()
-            
-            # Get screen resolution
-            res_result = subprocess.run(['adb', 'shell', 'wm', 'size'], 
-                                      capture_output=True, text=True)
-            resolution = res_result.stdout.strip()
+            # Get device model, Android version and screen resolution in one adb call
+            output = self._run_shell('getprop ro.product.model; echo ---; '
+                                     'getprop ro.build.version.release; echo ---; wm size')
+            model, android_version, resolution = [part.strip() for part in output.decode().split('---')]
             
             info = {
                 'model': model,
@@ -183,23 +317,17 @@ class QuestADBCapture:
         full_path = os.path.join(self.output_folder, filename)
         
         try:
-            # Take screenshot on device
+            # Stream the PNG straight to the local file (no temp file on the device)
             print("Taking screenshot...")
-            subprocess.run(['adb', 'shell', 'screencap', '-p', '/sdcard/screenshot.png'], 
-                          check=True)
+            png_data = self._shell_screencap(png=True)
             
-            # Pull screenshot to local machine
-            subprocess.run(['adb', 'pull', '/sdcard/screenshot.png', full_path], 
-                          check=True)
-            
-            # Clean up screenshot from device
-            subprocess.run(['adb', 'shell', 'rm', '/sdcard/screenshot.png'], 
-                          check=True)
+            with open(full_path, 'wb') as f:
+                f.write(png_data)
             
             print(f"Screenshot saved as: {full_path}")
             return full_path
             
-        except subprocess.CalledProcessError as e:
+        except (OSError, EOFError, RuntimeError) as e:
             print(f"Error taking screenshot: {e}")
             return False
     
@@ -223,15 +351,8 @@ class QuestADBCapture:
         try:
             print(f"Starting screen recording for {duration} seconds...")
             
-            # Start recording on device
-            recording_process = subprocess.Popen([
-                'adb', 'shell', 'screenrecord', 
-                f'--time-limit={duration}', 
-                '/sdcard/recording.mp4'
-            ])
-            
-            # Wait for recording to complete
-            recording_process.wait()
+            # Record on device; returns once the time limit is reached
+            self._run_shell(f'screenrecord --time-limit={duration} /sdcard/recording.mp4')
             
             # Pull recording to local machine
             print("Recording complete, downloading...")
@@ -239,13 +360,12 @@ class QuestADBCapture:
                           check=True)
             
             # Clean up recording from device
-            subprocess.run(['adb', 'shell', 'rm', '/sdcard/recording.mp4'], 
-                          check=True)
+            self._run_shell('rm /sdcard/recording.mp4')
             
             print(f"Recording saved as: {full_path}")
             return full_path
             
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, OSError, EOFError, RuntimeError) as e:
             print(f"Error recording screen: {e}")
             return False
     
@@ -258,37 +378,329 @@ class QuestADBCapture:
         print(f"Starting live stream at {fps} FPS. Press Ctrl+C to stop.")
         print(f"Frames will be saved to: {self.output_folder}")
         self.streaming = True
+        self._frame_count = 0
+        
+        # Report progress once a second instead of printing every frame; the event
+        # belongs to this run so a quick restart can't revive an old status thread
+        stopped = threading.Event()
+        status_thread = threading.Thread(target=self._print_stream_status, args=(stopped,), daemon=True)
+        status_thread.start()
         
         try:
-            frame_count = 0
+            deadline = time.monotonic()
             while self.streaming:
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                filename = f"frame_{frame_count:06d}.png"
+                filename = f"frame_{self._frame_count:06d}.png"
                 full_path = os.path.join(self.output_folder, filename)
                 
-                # Take screenshot
-                subprocess.run(['adb', 'shell', 'screencap', '-p', '/sdcard/temp_frame.png'], 
-                              check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                # Take screenshot over the persistent shell and write it to the output folder
+                png_data = self._shell_screencap(png=True)
                 
-                # Pull screenshot
-                subprocess.run(['adb', 'pull', '/sdcard/temp_frame.png', full_path], 
-                              check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                with open(full_path, 'wb') as f:
+                    f.write(png_data)
                 
-                print(f"Frame {frame_count} captured at {timestamp}")
-                frame_count += 1
+                self._frame_count += 1
                 
-                time.sleep(1.0 / fps)
+                deadline = self._wait_for_next_frame(deadline, fps)
                 
         except KeyboardInterrupt:
             print("\nStopping live stream...")
             self.streaming = False
+        finally:
+            stopped.set()
+    
+    def _print_stream_status(self, stopped):
+        """Print a single updating status line for the live stream once per second"""
+        last = 0
+        while not stopped.wait(1):
+            count = self._frame_count
+            print(f"Frames captured: {count} ({count - last} fps)   ", end='\r', flush=True)
+            last = count
+    
+    def _wait_for_next_frame(self, deadline, fps):
+        """Sleep until the next frame is due and return the new deadline"""
+        # Pace against a fixed schedule so capture time doesn't lower the frame rate
+        deadline += 1.0 / fps
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Capture overran the interval; restart the schedule instead of bursting
+            deadline = time.monotonic()
+        return deadline
+    
+    def _probe_exec_out(self):
+        """Check once whether the device supports binary-clean 'adb exec-out'"""
+        if self._use_exec_out is None:
+            try:
+                output = self._adb.run('echo x', timeout=2)
+            except _AdbServiceRefused:
+                self._use_exec_out = False
+            except (OSError, EOFError, RuntimeError) as e:
+                # Offline, still waking up or a busy server says nothing about exec-out; probe again next time
+                print(f"Could not check adb exec-out support: {e}")
+                return False
+            else:
+                self._use_exec_out = output == b'x\n'
+            if not self._use_exec_out:
+                print("adb exec-out not supported; falling back to slower 'adb shell' captures")
+        return self._use_exec_out
+    
+    def _open_shell(self):
+        """Open the persistent device shell shared by all shell commands"""
+        if self._shell is None:
+            # exec: is binary-clean and sh reads its commands from the same socket
+            self._shell = self._adb.open('exec:sh')
+            self._shell_out = self._shell.makefile('rb', buffering=0)
+        return self._shell
+    
+    def _close_shell(self):
+        """Shut down the persistent device shell if it is open"""
+        if self._shell is None:
+            return
+        self._shell_out.close()
+        self._shell.close()
+        self._shell = None
+        self._shell_out = None
+    
+    def _send_shell_command(self, command):
+        """Send a command to the shared shell, followed by a unique end-of-output tag"""
+        shell = self._open_shell()
+        self._shell_tag += 1
+        tag = b'__QUEST_CAP_%d__\n' % self._shell_tag
+        shell.sendall(command.encode() + b'\necho ' + tag)
+        return tag
+    
+    def _read_shell_output(self, tag, data=None):
+        """Read shared shell output up to the given tag, returning it without the tag"""
+        data = bytearray() if data is None else data
+        while not data.endswith(tag):
+            chunk = self._shell_out.read(65536)
+            if not chunk:
+                raise EOFError("ADB shell closed unexpectedly")
+            data += chunk
+        # Trim the tag in place rather than copying the output
+        del data[-len(tag):]
+        return data
+    
+    def _run_shell(self, command):
+        """Run a shell command on the device and return its output as a bytearray"""
+        if not self._probe_exec_out():
+            # Older devices only offer one-off 'shell:' streams, whose PTY mangles line endings
+            return bytearray(_fix_crlf(self._adb.run(command, 'shell')))
+        
+        with self._shell_lock:
+            try:
+                return self._read_shell_output(self._send_shell_command(command))
+            except BaseException:
+                # The shell is in an unknown state; start a fresh one next time
+                self._close_shell()
+                raise
+    
+    def _shell_screencap(self, png=False):
+        """Capture one frame, returning raw or PNG data as a bytearray"""
+        if png or not self._probe_exec_out():
+            data = self._run_shell('screencap -p' if png else 'screencap')
+            if png and not data.startswith(b'\x89PNG'):
+                raise RuntimeError(f"screencap failed: {data.decode(errors='replace').strip()}")
+            return data
+        
+        with self._shell_lock:
+            try:
+                tag = self._send_shell_command('screencap')
+                
+                # Raw frames have a known size once the header has been read
+                header = _read_exact(self._shell_out, 12)
+                width, height = struct.unpack('<II', header[:8])
+                if not (0 < width <= 16384 and 0 < height <= 16384):
+                    # Not a frame header; screencap printed an error instead
+                    message = self._read_shell_output(tag, header)
+                    raise RuntimeError(f"screencap failed: {message.decode(errors='replace').strip()}")
+                header_size = self._fheader or 12
+                
+                # Read the pixels straight into one buffer of the final size
+                data = bytearray(header_size + width * height * 4)
+                data[:12] = header
+                _readinto_exact(self._shell_out, memoryview(data)[12:])
+                
+                # Before the header size is known this also picks up the last few pixel bytes
+                tail = bytearray()
+                while not tail.endswith(tag):
+                    tail += _read_exact(self._shell_out, 1)
+                data += tail[:-len(tag)]
+                return data
+            except BaseException:
+                self._close_shell()
+                raise
+    
+    def _learn_frame_format(self):
+        """Probe one raw frame and specialise the frame path for the session's fixed size"""
+        if self._fw is not None:
+            return
+        
+        data = self._shell_screencap()
+        width, height, pixel_format = struct.unpack('<III', data[:12])
+        if pixel_format not in RAW_PIXEL_MODES:
+            raise ValueError(f"Unsupported screencap pixel format: {pixel_format}")
+        # Android 9+ appends a colour space field, so the header is 12 or 16 bytes
+        header_size = len(data) - width * height * 4
+        if header_size not in (12, 16):
+            raise ValueError(f"Unexpected raw frame size: {len(data)} bytes")
+        
+        self._fw, self._fh = width, height
+        self._fheader = header_size
+        self._fbytes = width * height * 4
+        self._fformat = pixel_format
+        # Frames are then pure reads plus a zero-copy wrap; no header parsing or size lookups
+        size = (width, height)
+        mode, rawmode = RAW_PIXEL_MODES[pixel_format]
+        self._frame_to_image = lambda pixels: Image.frombuffer(mode, size, pixels, 'raw', rawmode, 0, 1)
+    
+    def _reset_frame_pool(self):
+        """Mark every pooled frame buffer as free"""
+        self._free_slots = queue.Queue()
+        for slot in range(FRAME_POOL_SIZE):
+            self._free_slots.put(slot)
+    
+    def _release_slot(self, slot):
+        """Return a pooled frame buffer once nothing references its pixels"""
+        if slot is not None:
+            self._free_slots.put(slot)
+    
+    def _start_frame_server(self):
+        """Push and launch the on-device frame server and forward its TCP port"""
+        if self._frame_server is not None:
+            return
+        
+        subprocess.run(['adb', 'push', FRAME_SERVER_SCRIPT, FRAME_SERVER_DEVICE_PATH], 
+                      check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(['adb', 'forward', f'tcp:{FRAME_SERVER_PORT}', f'tcp:{FRAME_SERVER_PORT}'], 
+                      check=True, stdout=subprocess.DEVNULL)
+        self._frame_server = self._adb.open(f'shell:sh {FRAME_SERVER_DEVICE_PATH} {FRAME_SERVER_PORT}')
+        # The script prints its PID before exec'ing nc so the listener can be killed later
+        try:
+            pid = b''
+            while not pid.endswith(b'\n'):
+                chunk = self._frame_server.recv(32)
+                if not chunk:
+                    raise EOFError("Frame server exited before it started listening")
+                pid += chunk
+            self._frame_server_pid = int(pid)
+        except BaseException:
+            self._frame_server.close()
+            self._frame_server = None
+            raise
+        # Give nc a moment to start listening before the first connection
+        time.sleep(0.5)
+    
+    def _stop_frame_server(self):
+        """Stop the on-device frame server and remove the port forward"""
+        if self._frame_server is None:
+            return
+        try:
+            # Closing a non-PTY shell socket doesn't hang up nc, so kill the listener itself
+            self._run_shell(f'kill {self._frame_server_pid}')
+        except (OSError, EOFError, RuntimeError) as e:
+            print(f"Could not stop frame server: {e}")
+        self._frame_server.close()
+        self._frame_server = None
+        self._frame_server_pid = None
+        subprocess.run(['adb', 'forward', '--remove', f'tcp:{FRAME_SERVER_PORT}'], 
+                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    def _stream_raw_frames(self, use_socket=False):
+        """Yield (slot, pixels) raw RGBA frames from a screencap loop running on the device"""
+        self._learn_frame_format()
+        if self._frame_pool is None:
+            if NUMPY_AVAILABLE:
+                self._frame_pool = [np.empty((self._fh, self._fw, 4), dtype=np.uint8)
+                                    for _ in range(FRAME_POOL_SIZE)]
+            else:
+                self._frame_pool = [bytearray(self._fbytes) for _ in range(FRAME_POOL_SIZE)]
+        header = bytearray(self._fheader)
+        
+        # One long-lived exec stream or TCP connection; adbd dispatch is paid once per stream
+        sock = None
+        stream = None
+        if use_socket:
+            self._start_frame_server()
+            sock = socket.create_connection(('127.0.0.1', FRAME_SERVER_PORT), timeout=10)
+            stream = sock.makefile('rb', buffering=0)
+        elif self._probe_exec_out():
+            # adbd doesn't kill exec children on disconnect; the loop ends when a write fails
+            sock = self._adb.open('exec:while screencap; do :; done')
+            stream = sock.makefile('rb', buffering=0)
+        try:
+            while True:
+                # Wait for the display to hand a buffer back before reading the next frame
+                try:
+                    slot = self._free_slots.get(timeout=0.5)
+                except queue.Empty:
+                    if not self.streaming:
+                        return
+                    continue
+                
+                try:
+                    if stream is not None:
+                        _readinto_exact(stream, header)
+                        _readinto_exact(stream, self._frame_pool[slot])
+                    else:
+                        # Line ending fixes change the size, so each frame needs its own call
+                        data = self._shell_screencap()
+                        memoryview(self._frame_pool[slot]).cast('B')[:] = data[self._fheader:]
+                except BaseException:
+                    self._release_slot(slot)
+                    raise
+                yield slot, self._frame_pool[slot]
+        finally:
+            if sock is not None:
+                stream.close()
+                sock.close()
+    
+    def _stream_h264_frames(self):
+        """Yield (None, image) frames decoded from the device's hardware H.264 encoder"""
+        # screenrecord caps a session at 180s; the viewer reopens the stream when it ends
+        sock = self._adb.open('exec:screenrecord --output-format=h264 --time-limit=180 -')
+        output = sock.makefile('rb')
+        container = None
+        try:
+            container = av.open(output, format='h264')
+            
+            # Decode on several cores; slice threading suits hosts with only a couple of cores
+            video = container.streams.video[0]
+            cpu_count = os.cpu_count() or 1
+            video.thread_type = 'FRAME' if cpu_count > 2 else 'SLICE'
+            video.thread_count = cpu_count
             
-            # Clean up temp file
-            subprocess.run(['adb', 'shell', 'rm', '/sdcard/temp_frame.png'], 
-                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for frame in container.decode(video):
+                yield None, frame.to_image()
+        except av.error.FFmpegError as e:
+            raise RuntimeError(f"H.264 decode failed: {e}") from e
+        finally:
+            if container is not None:
+                container.close()
+            output.close()
+            sock.close()
     
-    def view_screen_realtime(self, fps=10, scale=0.5):
-        """Display Quest screen in real-time using a GUI window"""
+    def _scale_frame(self, img, scale):
+        """Resize a frame for the live preview"""
+        if scale == 0.5:
+            # Integer box reduction is much cheaper than a generic resize
+            return img.reduce(2)
+        
+        if scale != self._last_scale:
+            # Only recomputed when the user edits the scale entry; the size is stored first
+            # so a pipeline worker that sees the new scale also sees its size
+            self._new_wh = (int(img.width * scale), int(img.height * scale))
+            self._last_scale = scale
+        # Bilinear is plenty for a preview and far cheaper than LANCZOS
+        return img.resize(self._new_wh, Image.Resampling.BILINEAR)
+    
+    def view_screen_realtime(self, fps=10, scale=0.5, mode='screencap'):
+        """Display Quest screen in real-time using a GUI window
+        
+        mode is 'screencap' (raw framebuffer polling), 'socket' (raw frames from the
+        on-device frame server over a forwarded TCP port) or 'stream' (H.264 via PyAV)
+        """
         if not GUI_AVAILABLE:
             print("Real-time viewer not available. Please install required packages:")
             print("pip install pillow")
@@ -298,6 +710,13 @@ class QuestADBCapture:
             print("Device not connected")
             return False
         
+        if mode == 'stream' and not PYAV_AVAILABLE:
+            print("H.264 streaming needs PyAV (pip install av). Falling back to screencap.")
+            mode = 'screencap'
+        elif mode == 'stream' and not self._probe_exec_out():
+            print("H.264 streaming needs adb exec-out. Falling back to screencap.")
+            mode = 'screencap'
+        
         # Create GUI window
         root = tk.Tk()
         root.title("Oculus Quest - Live View")
@@ -331,6 +750,12 @@ class QuestADBCapture:
         scale_entry = tk.Entry(control_frame, textvariable=scale_var, width=5)
         scale_entry.pack(side=tk.LEFT, padx=5)
         
+        # Parse the controls only when they are edited, not on every frame
+        self._fps = _safe_float(str(fps), 10.0)
+        self._scale = _safe_float(str(scale), 0.5)
+        fps_var.trace_add('write', lambda *_: setattr(self, '_fps', _safe_float(fps_var.get(), 10.0)))
+        scale_var.trace_add('write', lambda *_: setattr(self, '_scale', _safe_float(scale_var.get(), 0.5)))
+        
         # Stop button
         def stop_viewing():
             self.streaming = False
@@ -340,43 +765,142 @@ class QuestADBCapture:
                                bg='red', fg='white')
         stop_button.pack(side=tk.LEFT, padx=10)
         
-        # Variables for threading
+        # Variables for threading; the queue holds (frame number, PhotoImage) pairs
         self.streaming = True
-        current_image = [None]
+        self._frame_q = queue.Queue(maxsize=2)
+        self._reset_frame_pool()
+        self._last_drawn_frame = -1
+        self._last_scale = None  # Stream frames may differ in size from screencap frames
         frame_count = [0]
+        display_photo = [None]
+        # PhotoImages recycled by the pipeline: one shown, up to two queued and one per frame
+        # in flight, so a free one always exists. ring_lock guards the ring, the indices
+        # being filled and every change to _frame_q or the shown photo.
+        photo_ring = [None] * (FRAME_POOL_SIZE + PIPELINE_DEPTH)
+        filling = set()
+        ring_lock = threading.Lock()
+        # Frames submitted for processing as (future, ring index), oldest first, and the window limiting them
+        in_flight = deque()
+        publish_lock = threading.Lock()
+        pipeline_slots = threading.Semaphore(PIPELINE_DEPTH)
+        
+        def claim_photo():
+            """Reserve a ring index whose PhotoImage is not shown, queued or being filled"""
+            with ring_lock:
+                busy = {id(photo) for _, photo in self._frame_q.queue}
+                busy.add(id(display_photo[0]))
+                for index, photo in enumerate(photo_ring):
+                    if index not in filling and (photo is None or id(photo) not in busy):
+                        filling.add(index)
+                        return index
+            raise RuntimeError("No free PhotoImage in the ring")
+        
+        def process_frame(number, index, slot, frame_data, current_scale):
+            """Pipeline stage: convert, scale and build the PhotoImage for one frame"""
+            try:
+                if mode == 'stream':
+                    img = frame_data
+                else:
+                    img = self._frame_to_image(frame_data)
+                
+                # Scale image
+                if current_scale != 1.0:
+                    img = self._scale_frame(img, current_scale)
+                
+                # Build the PhotoImage here so the UI thread only has to attach it
+                photo = photo_ring[index]
+                if photo is not None and (photo.width(), photo.height()) == img.size:
+                    photo.paste(img)
+                else:
+                    photo = ImageTk.PhotoImage(img, master=root)
+                    photo_ring[index] = photo
+                return number, photo
+            finally:
+                # Pixels have been copied into Tk, so the pooled buffer is free again
+                self._release_slot(slot)
+        
+        def publish_frames(_future=None):
+            """Hand finished frames to the display in capture order"""
+            with publish_lock:
+                while in_flight and in_flight[0][0].done():
+                    future, index = in_flight.popleft()
+                    try:
+                        frame = future.result()
+                        with ring_lock:
+                            frame_count[0] = frame[0]
+                            try:
+                                self._frame_q.put_nowait(frame)
+                            except queue.Full:
+                                # Drop the oldest frame so the display never lags behind
+                                try:
+                                    self._frame_q.get_nowait()
+                                except queue.Empty:
+                                    pass
+                                self._frame_q.put_nowait(frame)
+                    except Exception as e:
+                        print(f"Error processing image: {e}")
+                    finally:
+                        # Once queued, the photo is protected by being in _frame_q instead
+                        with ring_lock:
+                            filling.discard(index)
+                        pipeline_slots.release()
         
         def capture_frames():
             """Background thread for capturing frames"""
             try:
-                while self.streaming:
-                    current_fps = float(fps_var.get()) if fps_var.get().replace('.', '').isdigit() else 10
-                    current_scale = float(scale_var.get()) if scale_var.get().replace('.', '').isdigit() else 0.5
-                    
-                    # Take screenshot and get raw data
-                    result = subprocess.run(['adb', 'shell', 'screencap', '-p'], 
-                                          capture_output=True)
-                    
-                    if result.returncode == 0:
-                        # Convert raw screenshot data to PIL Image
-                        # Fix line ending issues with screencap -p
-                        raw_data = result.stdout.replace(b'\r\n', b'\n')
+                frames = None
+                deadline = time.monotonic()
+                submitted = 0
+                # Reading frame N+1 overlaps with processing of the frames still in flight
+                with ThreadPoolExecutor(max_workers=PIPELINE_DEPTH) as pipeline:
+                    while self.streaming:
+                        current_fps = self._fps
+                        current_scale = self._scale
                         
+                        # Read the next frame; raw framebuffers skip PNG encode on device and decode here
                         try:
-                            img = Image.open(io.BytesIO(raw_data))
-                            
-                            # Scale image
-                            if current_scale != 1.0:
-                                new_width = int(img.width * current_scale)
-                                new_height = int(img.height * current_scale)
-                                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                            
-                            current_image[0] = img
-                            frame_count[0] += 1
-                            
-                        except Exception as e:
-                            print(f"Error processing image: {e}")
+                            if frames is None:
+                                if mode == 'stream':
+                                    frames = self._stream_h264_frames()
+                                else:
+                                    frames = self._stream_raw_frames(use_socket=(mode == 'socket'))
+                            slot, frame_data = next(frames)
+                        except StopIteration:
+                            # Stream ended (e.g. screenrecord time limit); reopen it if still viewing
+                            frames = None
+                            frame_data = None
+                        except (OSError, EOFError, RuntimeError, ValueError, subprocess.CalledProcessError) as e:
+                            # The generator is finished after an error; reopen it next frame
+                            print(f"Error capturing frame: {e}")
+                            frames = None
+                            frame_data = None
+                        
+                        if frame_data is not None and mode == 'stream':
+                            # The encoder delivers frames at the headset's refresh rate; drop the ones
+                            # the display wouldn't show before they are converted, scaled and pasted
+                            now = time.monotonic()
+                            if now < deadline or not pipeline_slots.acquire(blocking=False):
+                                frame_data = None
+                            else:
+                                deadline = now + 1.0 / current_fps
+                        elif frame_data is not None:
+                            # Backpressure: never more than PIPELINE_DEPTH frames being processed
+                            pipeline_slots.acquire()
+                        
+                        if frame_data is not None:
+                            submitted += 1
+                            index = claim_photo()
+                            future = pipeline.submit(process_frame, submitted, index, slot, frame_data, current_scale)
+                            in_flight.append((future, index))
+                            future.add_done_callback(publish_frames)
+                        
+                        if mode != 'stream' or frames is None:
+                            # The H.264 stream is paced by the device encoder and thinned above;
+                            # only wait before reopening it after it ended or failed
+                            deadline = self._wait_for_next_frame(deadline, current_fps)
                     
-                    time.sleep(1.0 / current_fps)
+                    if frames is not None:
+                        frames.close()
                     
             except Exception as e:
                 print(f"Error in capture thread: {e}")
@@ -384,27 +908,52 @@ class QuestADBCapture:
         
         def update_display():
             """Update the GUI with the latest frame"""
-            if current_image[0] and self.streaming:
+            # Poll at the target frame rate rather than a fixed 50ms, never faster than ~60Hz
+            interval = max(16, int(1000 / max(self._fps, 1)))
+            
+            if frame_count[0] == self._last_drawn_frame:
+                # Nothing new has been captured since the last redraw
+                if self.streaming:
+                    root.after(interval, update_display)
+                return
+            
+            with ring_lock:
+                try:
+                    frame_number, photo = self._frame_q.get_nowait()
+                except queue.Empty:
+                    photo = None
+                # Mark the photo as shown before it leaves the queue's protection; pastes
+                # into the old one only run on this thread after the label has switched
+                shown = display_photo[0]
+                if photo is not None and self.streaming:
+                    display_photo[0] = photo
+            
+            if photo is not None and self.streaming:
                 try:
-                    # Convert PIL image to PhotoImage for tkinter
-                    photo = ImageTk.PhotoImage(current_image[0])
-                    image_label.configure(image=photo)
-                    image_label.image = photo  # Keep a reference
+                    # The PhotoImage is ready; only attach it if the label isn't showing it already
+                    if photo is not shown:
+                        image_label.configure(image=photo)
+                        image_label.image = photo  # Keep a reference
                     
                     # Update status
                     timestamp = datetime.now().strftime("%H:%M:%S")
-                    status_text = f"Frame {frame_count[0]} - {timestamp} - {current_image[0].size[0]}x{current_image[0].size[1]}"
+                    status_text = f"Frame {frame_number} - {timestamp} - {photo.width()}x{photo.height()}"
                     status_label.configure(text=status_text)
+                    self._last_drawn_frame = frame_number
                     
                 except Exception as e:
                     status_label.configure(text=f"Display error: {e}")
             
             if self.streaming:
-                root.after(50, update_display)  # Update display every 50ms
+                root.after(interval, update_display)
+        
+        # Pillow installs its Tk paste hook on the first paste (which creating a PhotoImage
+        # does); trigger it here so the hook is registered from the interpreter's own thread
+        ImageTk.PhotoImage(Image.new('RGB', (1, 1)), master=root)
         
-        # Start capture thread
+        # Start capture thread once the Tk main loop is running, since it creates PhotoImages
         capture_thread = threading.Thread(target=capture_frames, daemon=True)
-        capture_thread.start()
+        root.after(0, capture_thread.start)
         
         # Start display updates
         root.after(100, update_display)
@@ -418,12 +967,21 @@ class QuestADBCapture:
             pass
         finally:
             self.streaming = False
+            # Keep serving Tk calls queued by the pipeline until the capture thread has drained
+            # it, so no worker is left blocked and no old thread returns a slot to the next pool
+            while capture_thread.is_alive():
+                root.update()
+                time.sleep(0.01)
+            root.destroy()
             print("Real-time viewer stopped")
         
         return True
     
     def disconnect(self):
         """Disconnect from the device"""
+        # The frame server is stopped through the shell, so stop it first
+        self._stop_frame_server()
+        self._close_shell()
         if self.device_ip:
             subprocess.run(['adb', 'disconnect', f'{self.device_ip}:{self.adb_port}'])
             print("Disconnected from device")
@@ -492,7 +1050,12 @@ def main():
                 fps = int(fps) if fps.isdigit() else 10
                 scale = input("Enter scale factor (default 0.5): ").strip()
                 scale = float(scale) if scale.replace('.', '').isdigit() else 0.5
-                capture.view_screen_realtime(fps, scale)
+                if PYAV_AVAILABLE:
+                    prompt = "Capture mode: (1) screencap, (2) TCP frame server, (3) H.264 stream (default 1): "
+                else:
+                    prompt = "Capture mode: (1) screencap, (2) TCP frame server (default 1): "
+                mode = {'2': 'socket', '3': 'stream'}.get(input(prompt).strip(), 'screencap')
+                capture.view_screen_realtime(fps, scale, mode)
             
         elif choice == "5":
             capture.get_device_info()